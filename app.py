@@ -1,8 +1,19 @@
+import hashlib
+import os
+import pickle
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 from linearmodels.panel import PanelOLS
 
+# Numba opsional: dipakai untuk kernel prediksi batch; tanpa numba
+# jatuh ke versi numpy vektor yang tetap benar, hanya lebih lambat.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
+
 # Konfigurasi halaman
 st.set_page_config(
     page_title="Analisis Regresi Panel Kemiskinan",
@@ -12,53 +23,202 @@ st.set_page_config(
 
 # --- FUNGSI UNTUK MEMUAT DAN MEMPROSES DATA ---
 # Menggunakan cache agar data tidak perlu dimuat ulang setiap kali ada interaksi
-@st.cache_data
-def load_and_process_data():
-    # Membaca data
-    df = pd.read_excel("Data_KP.xlsx", sheet_name="dataset")
+DATA_FILE = "Data_KP.xlsx"
+CACHE_DIR = ".cache"
+# Naikkan bila format isi cache berubah, agar pickle lama tidak terbaca
+CACHE_VERSION = 3
 
-    # Mengubah tipe data
-    df["kode_kabupaten_kota"] = df["kode_kabupaten_kota"].astype(str)
-    df["tahun"] = df["tahun"].astype(int)
 
-    # Set MultiIndex
-    df.set_index(["kode_kabupaten_kota", "tahun"], inplace=True)
+def _cache_path(kind):
+    # Kunci cache dari hash isi file + mtime, sehingga cache otomatis
+    # kadaluarsa bila Data_KP.xlsx berubah.
+    with open(DATA_FILE, "rb") as f:
+        digest = hashlib.blake2b(f.read()).hexdigest()
+    mtime = int(os.path.getmtime(DATA_FILE))
+    return os.path.join(CACHE_DIR, f"{digest}-{mtime}-v{CACHE_VERSION}-{kind}.pkl")
+
 
-    # Memilih dan mengubah kolom menjadi numerik
+def _read_panel_frame():
+    # Engine calamine (berbasis Rust) jauh lebih cepat daripada openpyxl;
+    # fallback ke openpyxl bila python-calamine belum terpasang.
+    # Tipe data langsung ditetapkan saat parse, sehingga tidak perlu lagi
+    # pass astype / to_numeric per kolom (masing-masing menyalin array baru).
     selected_columns = [
         "garis_kemiskinan", "IPM", "TPAK", "upah_minimum", "TPT", "jumlah_penduduk_miskin"
     ]
-    df[selected_columns] = df[selected_columns].apply(pd.to_numeric, errors='coerce')
+    dtype_map = {"kode_kabupaten_kota": str, "tahun": "int64"}
+    dtype_map.update({col: "float64" for col in selected_columns})
+    try:
+        df = pd.read_excel("Data_KP.xlsx", sheet_name="dataset",
+                           engine="calamine", dtype=dtype_map)
+    except ImportError:
+        df = pd.read_excel("Data_KP.xlsx", sheet_name="dataset", dtype=dtype_map)
+
+    # Dtype category: label kabupaten didukung array kode integer, sehingga
+    # operasi index/grup di hilir tidak membayar hashing string per baris
+    df["kode_kabupaten_kota"] = df["kode_kabupaten_kota"].astype("category")
+
+    # Simpan lookup nama kabupaten/kota sebelum kolomnya hilang karena set_index
+    nama_kabupaten = df[['kode_kabupaten_kota', 'nama_kabupaten_kota']].drop_duplicates()
+
+    # Set MultiIndex
+    df.set_index(["kode_kabupaten_kota", "tahun"], inplace=True)
+
+    # Buang baris yang tidak lengkap (satu pass, tanpa konversi ulang)
     df.dropna(subset=selected_columns, inplace=True)
 
+    return df, nama_kabupaten, selected_columns
+
+
+def _fit_fem(df, cov_type):
     # Estimasi model FEM yang terpilih (dari notebook Anda)
     # Kita gunakan semua variabel signifikan dan tidak signifikan untuk ringkasan,
     # tapi hanya yang signifikan untuk prediksi.
-    fem_model = PanelOLS.from_formula(
+    return PanelOLS.from_formula(
         "garis_kemiskinan ~ IPM + TPAK + upah_minimum + TPT + jumlah_penduduk_miskin + EntityEffects",
         data=df
-    ).fit(cov_type='robust')
+    ).fit(cov_type=cov_type)
+
+
+def _build_prediction_cache():
+    # Bangun bundel prediksi. Titik estimasi (koefisien + fixed effects)
+    # tidak bergantung pada cov_type, jadi di jalur ini cukup kovarians
+    # 'unadjusted' yang murah; sandwich robust hanya dihitung bila
+    # ringkasan model diminta (lihat load_model_summary).
+    df, nama_kabupaten, selected_columns = _read_panel_frame()
+    fem_model = _fit_fem(df, 'unadjusted')
 
     # Ekstrak koefisien dan intersep (fixed effects)
     coefficients = fem_model.params
-    intercepts = fem_model.estimated_effects.reset_index()
-    intercepts.columns = ['kode_kabupaten_kota', 'tahun', 'intersep']
-    
-    # Ambil intersep unik per kabupaten/kota (kita asumsikan intersep stabil)
-    unique_intercepts = intercepts.groupby('kode_kabupaten_kota')['intersep'].mean().reset_index()
+    # Ambil intersep unik per kabupaten/kota (kita asumsikan intersep stabil).
+    # Reduksi mean langsung pada Series ber-MultiIndex: kode grup sudah
+    # tersedia di index.codes, jadi tidak perlu reset_index + rename +
+    # factorize yang semuanya membuat DataFrame/array perantara.
+    effects = fem_model.estimated_effects['estimated_effects']
+    codes = effects.index.codes[0]
+    uniques = effects.index.levels[0]
+    sums = np.bincount(codes, weights=effects.to_numpy(), minlength=len(uniques))
+    counts = np.bincount(codes, minlength=len(uniques))
+    mask = counts > 0
+    unique_intercepts = pd.DataFrame({
+        'kode_kabupaten_kota': np.asarray(uniques)[mask],
+        'intersep': sums[mask] / counts[mask],
+    })
+
+    # Petakan nama kabupaten/kota lewat dict; hash join pd.merge terlalu
+    # berat untuk lookup sekecil ini.
+    name_by_code = dict(zip(nama_kabupaten['kode_kabupaten_kota'],
+                            nama_kabupaten['nama_kabupaten_kota']))
+    unique_intercepts['nama_kabupaten_kota'] = \
+        unique_intercepts['kode_kabupaten_kota'].map(name_by_code)
+
+    # Bundel prediksi: hanya skalar + dict kecil, bukan objek model penuh
+    pred = {
+        "coef_ipm": float(coefficients['IPM']),
+        "coef_upah": float(coefficients['upah_minimum']),
+        "intercepts_by_name": dict(zip(unique_intercepts['nama_kabupaten_kota'],
+                                       unique_intercepts['intersep'])),
+        "mean_intersep": float(unique_intercepts['intersep'].mean()),
+        "ipm_stats": (float(df['IPM'].min()), float(df['IPM'].max()), float(df['IPM'].mean())),
+        # Tuple immutable: opsi dropdown tidak perlu dibangun ulang per rerun
+        "list_kabupaten": tuple(unique_intercepts['nama_kabupaten_kota']),
+    }
 
-    # Gabungkan nama kabupaten/kota dari data asli
-    nama_kabupaten = pd.read_excel("Data_KP.xlsx", sheet_name="dataset")[['kode_kabupaten_kota', 'nama_kabupaten_kota']].drop_duplicates()
-    nama_kabupaten['kode_kabupaten_kota'] = nama_kabupaten['kode_kabupaten_kota'].astype(str)
-    
-    unique_intercepts = pd.merge(unique_intercepts, nama_kabupaten, on='kode_kabupaten_kota')
+    # Simpan hanya tabel describe(), bukan DataFrame penuh: satu-satunya
+    # pemakaian df di luar fungsi ini adalah statistika deskriptif.
+    desc = df[selected_columns].describe()
+    prediction_bundle = (desc, pred)
+
+    # Tulis cache untuk boot berikutnya
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_cache_path("pred"), "wb") as f:
+        pickle.dump(prediction_bundle, f)
+
+    return prediction_bundle
+
+
+@st.cache_data
+def load_prediction_bundle():
+    # Cache di disk: server boot / sesi baru tidak perlu parse Excel
+    # dan fit PanelOLS ulang (st.cache_data hanya hidup per proses).
+    cache_path = _cache_path("pred")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    return _build_prediction_cache()
+
+
+@st.cache_data
+def load_model_summary():
+    # Ringkasan model hanya dibutuhkan bila pengguna membuka expander,
+    # jadi fit robust (untuk standard error yang benar di tabel ringkasan)
+    # dilakukan lazy dan hasil teksnya disimpan ke disk.
+    cache_path = _cache_path("summary")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+
+    df, _, _ = _read_panel_frame()
+    summary_text = _fit_fem(df, 'robust').summary.as_text()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_path, "wb") as f:
+        pickle.dump(summary_text, f)
+    return summary_text
 
-    # Kembalikan semua variabel yang dibutuhkan di luar fungsi
-    return df, fem_model, coefficients, unique_intercepts, selected_columns # <-- DIUBAH
 
 # Memuat data menggunakan fungsi yang sudah dibuat
-# Menangkap variabel selected_columns yang sudah dikembalikan
-df, fem_model, coefficients, unique_intercepts, selected_columns = load_and_process_data() # <-- DIUBAH
+desc, pred = load_prediction_bundle()
+
+# Konstanta widget di level modul: nilai-nilai tetap antar rerun sehingga
+# kunci hash widget Streamlit stabil dan tidak ada reduksi per-event.
+IPM_MIN, IPM_MAX, IPM_MEAN = pred["ipm_stats"]
+IPM_STEP = 0.1
+# Nilai awal di-snap ke grid slider agar cocok dengan tabel lookup di bawah
+IPM_DEFAULT = IPM_MIN + round((IPM_MEAN - IPM_MIN) / IPM_STEP) * IPM_STEP
+UPAH_MIN = 1000000
+UPAH_MAX = 6000000
+UPAH_DEFAULT = 2500000
+UPAH_STEP = 500000
+
+
+@st.cache_data
+def build_prediction_table(coef_ipm, coef_upah, intercepts_by_name):
+    # Slider hanya bisa mencapai grid diskrit (IPM per 0.1, upah per
+    # 500 ribu), jadi seluruh hasil prediksi dapat dihitung sekali sebagai
+    # tabel 3-D [kabupaten, ipm, upah]; jalur prediksi per rerun tinggal
+    # satu pembacaan array.
+    n_ipm = int(round((IPM_MAX - IPM_MIN) / IPM_STEP)) + 1
+    ipm_grid = IPM_MIN + np.arange(n_ipm) * IPM_STEP
+    # Slider selalu bisa memilih nilai maksimum meski di luar kelipatan
+    # step; tambahkan IPM_MAX sebagai titik grid terakhir bila belum ada
+    if ipm_grid[-1] < IPM_MAX - 1e-9:
+        ipm_grid = np.append(ipm_grid, IPM_MAX)
+    upah_grid = np.arange(UPAH_MIN, UPAH_MAX + 1, UPAH_STEP)
+    intercept_arr = np.array(list(intercepts_by_name.values()))
+    table = (coef_ipm * ipm_grid[None, :, None]
+             + coef_upah * upah_grid[None, None, :]
+             + intercept_arr[:, None, None])
+    kab_index = {nama: i for i, nama in enumerate(intercepts_by_name)}
+    return table, kab_index
+
+
+PRED_TABLE, KAB_INDEX = build_prediction_table(
+    pred["coef_ipm"], pred["coef_upah"], pred["intercepts_by_name"])
+
+INTERCEPT_ARR = np.array(list(pred["intercepts_by_name"].values()))
+
+if njit is not None:
+    # Kernel numerik ketat untuk simulasi batch; numba mengompilasinya ke
+    # kode native ber-SIMD dengan loop paralel.
+    @njit(fastmath=True, parallel=True, cache=True)
+    def _predict_batch(ipm, upah, kab_idx, intercepts, coef_ipm, coef_upah):
+        out = np.empty(ipm.shape[0])
+        for i in prange(ipm.shape[0]):
+            out[i] = coef_ipm * ipm[i] + coef_upah * upah[i] + intercepts[kab_idx[i]]
+        return out
+else:
+    def _predict_batch(ipm, upah, kab_idx, intercepts, coef_ipm, coef_upah):
+        return coef_ipm * ipm + coef_upah * upah + intercepts[kab_idx]
 
 # --- TAMPILAN APLIKASI STREAMLIT ---
 
@@ -69,43 +229,57 @@ st.write("Aplikasi ini dibuat berdasarkan hasil analisis regresi data panel untu
 # --- SIDEBAR UNTUK INPUT PREDIKSI ---
 st.sidebar.header("⚙️ Simulasi Prediksi")
 
-# Mendapatkan daftar nama kabupaten/kota untuk dropdown
-list_kabupaten = unique_intercepts['nama_kabupaten_kota'].tolist()
-selected_kabupaten_nama = st.sidebar.selectbox("Pilih Kabupaten/Kota:", list_kabupaten)
-
-# Input slider untuk IPM
-st.sidebar.markdown("**Input Variabel Signifikan:**")
-input_ipm = st.sidebar.slider(
-    "Indeks Pembangunan Manusia (IPM):",
-    min_value=float(df['IPM'].min()),
-    max_value=float(df['IPM'].max()),
-    value=float(df['IPM'].mean()),
-    step=0.1
-)
+# Form membatch ketiga input: script baru rerun saat tombol "Hitung"
+# ditekan, bukan pada setiap geser slider / ganti pilihan.
+with st.sidebar.form("sim"):
+    # Daftar nama kabupaten/kota sudah tersedia sebagai tuple di bundel
+    selected_kabupaten_nama = st.selectbox("Pilih Kabupaten/Kota:", pred["list_kabupaten"])
 
-# Upah Minimum
-input_upah = st.sidebar.slider(
-    "Geser untuk memilih Upah Minimum (Rp):",
-    min_value=1000000,
-    max_value=6000000,
-    value=2500000,
-    step=500000
-    # Parameter 'format' dihapus untuk stabilitas
-)
+    # Input slider untuk IPM
+    st.markdown("**Input Variabel Signifikan:**")
+    input_ipm = st.slider(
+        "Indeks Pembangunan Manusia (IPM):",
+        min_value=IPM_MIN,
+        max_value=IPM_MAX,
+        value=IPM_DEFAULT,
+        step=IPM_STEP
+    )
+
+    # Upah Minimum
+    input_upah = st.slider(
+        "Geser untuk memilih Upah Minimum (Rp):",
+        min_value=UPAH_MIN,
+        max_value=UPAH_MAX,
+        value=UPAH_DEFAULT,
+        step=UPAH_STEP
+        # Parameter 'format' dihapus untuk stabilitas
+    )
+
+    submitted = st.form_submit_button("Hitung")
 
 # Menampilkan nilai yang dipilih dengan format di bawah slider
 st.sidebar.markdown(f"**Nilai terpilih:** `Rp {input_upah:,.0f}`")
 
-# Ambil koefisien dari model HANYA UNTUK VARIABEL SIGNIFIKAN
-coef_ipm = coefficients['IPM']
-coef_upah = coefficients['upah_minimum']
+# Ambil koefisien dari bundel prediksi HANYA UNTUK VARIABEL SIGNIFIKAN
+coef_ipm = pred["coef_ipm"]
+coef_upah = pred["coef_upah"]
 
-# Ambil intersep untuk kabupaten/kota yang dipilih
-selected_intercept_row = unique_intercepts[unique_intercepts['nama_kabupaten_kota'] == selected_kabupaten_nama]
-intersep = selected_intercept_row['intersep'].iloc[0] if not selected_intercept_row.empty else unique_intercepts['intersep'].mean()
+# Ambil intersep untuk kabupaten/kota yang dipilih.
+# Lookup dict O(1), bukan boolean mask pandas yang dijalankan ulang
+# pada setiap geser slider.
+intersep = pred["intercepts_by_name"].get(selected_kabupaten_nama, pred["mean_intersep"])
 
-# Hitung prediksi HANYA berdasarkan variabel signifikan
-prediksi = (coef_ipm * input_ipm) + (coef_upah * input_upah) + intersep
+# Hitung prediksi HANYA berdasarkan variabel signifikan: ambil langsung
+# dari tabel yang sudah dihitung di muka (semua kombinasi slider sudah ada)
+kab_idx = KAB_INDEX[selected_kabupaten_nama]
+if input_ipm >= IPM_MAX - 1e-9:
+    # Titik maksimum slider menempati slot grid terakhir (bisa di luar
+    # kelipatan step)
+    ipm_idx = PRED_TABLE.shape[1] - 1
+else:
+    ipm_idx = min(int(round((input_ipm - IPM_MIN) / IPM_STEP)), PRED_TABLE.shape[1] - 2)
+upah_idx = (input_upah - UPAH_MIN) // UPAH_STEP
+prediksi = float(PRED_TABLE[kab_idx, ipm_idx, upah_idx])
 
 # --- TAMPILAN UTAMA (MAIN AREA) ---
 
@@ -137,10 +311,14 @@ with col2:
 
 # Expander untuk menampilkan detail model dan data
 st.markdown("---")
-with st.expander("Lihat Detail Analisis dan Data"):
+with st.expander("Lihat Detail Analisis dan Data", expanded=False):
     st.subheader("Ringkasan Model Fixed Effect (FEM)")
-    # Menampilkan ringkasan model dalam format teks
-    st.code(fem_model.summary.as_text())
+    # Ringkasan dimuat lazy: baru dibaca dari cache saat diminta,
+    # sehingga reload biasa tidak menyentuh bundel ringkasan sama sekali.
+    if st.button("Tampilkan ringkasan model"):
+        st.session_state["show_details"] = True
+    if st.session_state.get("show_details"):
+        st.code(load_model_summary())
     st.markdown(
         """
         **Interpretasi Penting:**
@@ -151,5 +329,35 @@ with st.expander("Lihat Detail Analisis dan Data"):
     )
 
     st.subheader("Statistika Deskriptif Data Asli")
-    # Baris ini sekarang tidak akan error lagi
-    st.dataframe(df[selected_columns].describe())
+    st.dataframe(desc)
+
+
+# --- SIMULASI BATCH (WHAT-IF) ---
+st.markdown("---")
+with st.expander("Simulasi Batch (unggah CSV skenario)", expanded=False):
+    st.write(
+        "Unggah CSV berkolom `nama_kabupaten_kota`, `IPM`, dan `upah_minimum` "
+        "untuk menghitung prediksi banyak skenario sekaligus."
+    )
+    uploaded = st.file_uploader("Pilih file CSV:", type="csv")
+    if uploaded is not None:
+        batch = pd.read_csv(uploaded)
+        required = {"nama_kabupaten_kota", "IPM", "upah_minimum"}
+        missing = required - set(batch.columns)
+        if missing:
+            st.error(f"Kolom berikut tidak ditemukan di CSV: {', '.join(sorted(missing))}")
+        else:
+            kab_idx = batch["nama_kabupaten_kota"].map(KAB_INDEX)
+            if kab_idx.isna().any():
+                unknown = batch.loc[kab_idx.isna(), "nama_kabupaten_kota"].unique()
+                st.error(f"Nama kabupaten/kota tidak dikenal: {', '.join(map(str, unknown))}")
+            else:
+                batch["prediksi_garis_kemiskinan"] = _predict_batch(
+                    batch["IPM"].to_numpy(dtype=np.float64),
+                    batch["upah_minimum"].to_numpy(dtype=np.float64),
+                    kab_idx.to_numpy(dtype=np.int64),
+                    INTERCEPT_ARR,
+                    pred["coef_ipm"],
+                    pred["coef_upah"],
+                )
+                st.dataframe(batch)